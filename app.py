@@ -1,8 +1,11 @@
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
 import pydeck as pdk
-import plotly.express as px
+import h3
+from h3.api.numpy_int import latlng_to_cell
+from numba import njit
 import plotly.graph_objects as go
 from datetime import datetime
 
@@ -16,8 +19,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# INJECTING HIGH-END CSS
-st.markdown("""
+# HIGH-END CSS: a module-level constant, kept out of the per-rerun render code
+CSS = """
 <style>
     /* IMPORT FUTURISTIC FONT */
     @import url('https://fonts.googleapis.com/css2?family=Rajdhani:wght@500;700&display=swap');
@@ -83,33 +86,184 @@ st.markdown("""
         padding-bottom: 10px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(CSS, unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # 2. DATA ENGINE
 # -----------------------------------------------------------------------------
+# Bump whenever read_incidents' derived columns change so stale Parquet copies are rebuilt
+CACHE_VERSION = 4
+
+# H3 resolution 9 cells have ~200m edges, matching the old HexagonLayer radius
+H3_RES = 9
+
+def read_incidents():
+    # Robust loading: Check local first, then subfolder
+    csv_path = "crime_data.csv"
+    if not os.path.exists(csv_path):
+        csv_path = "crime-dashboard/crime_data.csv"
+    parquet_path = f"{os.path.splitext(csv_path)[0]}.v{CACHE_VERSION}.parquet"
+
+    # Cold start: reuse the typed Parquet copy unless the CSV is newer
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path):
+        try:
+            return pd.read_parquet(parquet_path)
+        except Exception:
+            pass  # Unreadable copy: reparse the CSV below and rewrite it
+
+    # Arrow parser, with labels kept as Arrow strings until they are categorised
+    df = pd.read_csv(
+        csv_path,
+        engine="pyarrow",
+        dtype={'zone': 'string[pyarrow]', 'crime_type': 'string[pyarrow]'},
+    )
+        
+    # Processing
+    df['date'] = pd.to_datetime(df['date'])
+    # Undated rows can never fall in a date window; drop them before the int casts
+    df = df.dropna(subset=['date']).reset_index(drop=True)
+    # Days since epoch, so daily trends are a bincount rather than a groupby.
+    # Must follow the NaT drop: the int cast silently maps NaT to 1970-01-01.
+    df['day_idx'] = df['date'].values.astype('datetime64[D]').astype('int32')
+    df['hour'] = df['date'].dt.hour.astype('uint8')
+    # H3 cell per incident as uint64; depends only on the coordinates, so it is
+    # assigned once here and persisted with the Parquet copy. Rows without
+    # coordinates still count in the KPIs but get cell 0 (never a valid H3
+    # index), which keeps them off the map.
+    lat = df['latitude'].to_numpy(dtype='float64', na_value=np.nan)
+    lon = df['longitude'].to_numpy(dtype='float64', na_value=np.nan)
+    located = ~(np.isnan(lat) | np.isnan(lon))
+    cells = np.zeros(len(df), dtype=np.uint64)
+    cells[located] = np.fromiter(
+        (latlng_to_cell(la, lo, H3_RES) for la, lo in zip(lat[located], lon[located])),
+        dtype=np.uint64,
+        count=int(located.sum()),
+    )
+    df['h3'] = cells
+    
+    # Low-cardinality labels as categoricals so filters run on int codes
+    df['zone'] = df['zone'].astype('category')
+    df['crime_type'] = df['crime_type'].astype('category')
+    
+    # Write beside the target and swap it in, so an interrupted write never
+    # leaves a truncated copy at parquet_path
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, parquet_path)
+    except Exception:
+        # Read-only deploys just parse the CSV each cold start
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return df
+
 @st.cache_data
 def load_data():
     try:
-        # Robust loading: Check local first, then subfolder
-        try:
-            df = pd.read_csv("crime_data.csv")
-        except FileNotFoundError:
-            df = pd.read_csv("crime-dashboard/crime_data.csv")
-            
-        # Processing
-        df['date'] = pd.to_datetime(df['date'])
-        df['hour'] = df['date'].dt.hour
-        
-        # --- THE FIX IS HERE ---
-        # Convert date objects to string to prevent JSON serialization error
-        df['day'] = df['date'].dt.date.astype(str) 
-        
-        return df
+        df = read_incidents()
+
+        # Sidebar options and bounds, computed once per dataset version
+        zone_opts = tuple(df['zone'].cat.categories)
+        crime_opts = tuple(df['crime_type'].cat.categories)
+        min_date = df['date'].min().date()
+        max_date = df['date'].max().date()
+
+        return df, zone_opts, crime_opts, min_date, max_date
     except Exception as e:
-        return pd.DataFrame()
+        return pd.DataFrame(), (), (), None, None
+
+df, zone_opts, crime_opts, min_date, max_date = load_data()
+
+def aggregate_hexes(frame):
+    cells = frame['h3'].to_numpy()
+    cells, cell_counts = np.unique(cells[cells != 0], return_counts=True)
+    # deck.gl reads JSON numbers as doubles, so cells go over the wire as hex strings
+    return pd.DataFrame({'h3': [h3.int_to_str(c) for c in cells], 'count': cell_counts})
 
-df = load_data()
+def most_common(col):
+    codes = col.cat.codes.to_numpy()
+    codes = codes[codes >= 0]  # blank labels are code -1, skipped like mode() skips NaN
+    return col.cat.categories[np.bincount(codes, minlength=len(col.cat.categories)).argmax()]
+
+@njit(cache=True)
+def filter_and_bin(day_idx, zone_codes, crime_codes, zone_lut, crime_lut, d0, d1, mask, day_counts):
+    # One fused pass: day-window test, O(1) category lookups and the daily
+    # trend increment. Serial on purpose; a prange loop would race on day_counts.
+    # Blank labels have code -1, which numba would wrap to the last LUT entry.
+    for i in range(day_idx.shape[0]):
+        d = day_idx[i]
+        z = zone_codes[i]
+        c = crime_codes[i]
+        if d0 <= d <= d1 and z >= 0 and c >= 0 and zone_lut[z] and crime_lut[c]:
+            mask[i] = True
+            day_counts[d - d0] += 1
+
+def category_lut(col, selected):
+    lut = np.zeros(len(col.cat.categories), dtype=np.bool_)
+    idx = col.cat.categories.get_indexer(selected)
+    lut[idx[idx >= 0]] = True
+    return lut
+
+def filter_mask(filter_key):
+    # Reads the module-level df (itself cached by load_data) so callers can be
+    # cached on the hashable filter_key without ever hashing the frame.
+    # Returns the row mask plus per-day counts over the [start, end] window.
+    start, end, zones_t, crimes_t = filter_key
+    d0 = int(np.datetime64(start, 'D').astype(np.int64))
+    d1 = int(np.datetime64(end, 'D').astype(np.int64))
+    mask = np.zeros(len(df), dtype=np.bool_)
+    day_counts = np.zeros(max(d1 - d0 + 1, 0), dtype=np.int64)
+    filter_and_bin(
+        df['day_idx'].to_numpy(),
+        df['zone'].cat.codes.to_numpy(),
+        df['crime_type'].cat.codes.to_numpy(),
+        category_lut(df['zone'], zones_t),
+        category_lut(df['crime_type'], crimes_t),
+        d0, d1, mask, day_counts,
+    )
+    return mask, day_counts, d0
+
+@st.cache_data(show_spinner=False)
+def compute_view(filter_key):
+    # Only small aggregates and the data-log slice are returned (and pickled
+    # into the cache); the full filtered frame stays local
+    mask, day_counts, d0 = filter_mask(filter_key)
+    filtered_df = df.iloc[mask]
+
+    if filtered_df.empty:
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), {}
+
+    counts = filtered_df['crime_type'].value_counts().reset_index()
+    counts.columns = ['Type', 'Count']
+    counts = counts[counts['Count'] > 0]  # categoricals report unselected codes as 0
+
+    # Daily trend, already binned by the filter pass
+    active = day_counts.nonzero()[0]
+    trend = pd.DataFrame({
+        'date': (active + d0).astype('datetime64[D]'),
+        'Count': day_counts[active],
+    })
+
+    # One row per non-empty hexagon instead of every raw incident
+    hexes = aggregate_hexes(filtered_df)
+
+    # Modes via a single counting pass over the integer codes; argmax keeps
+    # the lowest code on ties, same as mode()[0]
+    peak_hour = np.bincount(filtered_df['hour'].to_numpy(), minlength=24).argmax()
+    kpis = {
+        "total": len(filtered_df),
+        "risk_zone": most_common(filtered_df['zone']),
+        "primary_code": most_common(filtered_df['crime_type']),
+        "peak_h": f"{peak_hour}:00",
+    }
+
+    # Latest 500 only: partial selection instead of sorting the whole window
+    log_rows = filtered_df.nlargest(500, 'date')[['date', 'hour', 'zone', 'crime_type', 'latitude', 'longitude']]
+
+    return counts, trend, hexes, log_rows, kpis
 
 # -----------------------------------------------------------------------------
 # 3. SIDEBAR CONTROLS
@@ -120,49 +274,45 @@ with st.sidebar:
     
     if not df.empty:
         # Date Filter
-        min_date = df['date'].min().date()
-        max_date = df['date'].max().date()
         dates = st.date_input("TEMPORAL WINDOW", [min_date, max_date], min_value=min_date, max_value=max_date)
         
         # Multiselects
-        zones = st.multiselect("SECTORS", df['zone'].unique(), default=df['zone'].unique())
-        crimes = st.multiselect("OFFENSE CODES", df['crime_type'].unique(), default=df['crime_type'].unique())
+        zones = st.multiselect("SECTORS", zone_opts, default=zone_opts)
+        crimes = st.multiselect("OFFENSE CODES", crime_opts, default=crime_opts)
         
         # Apply Filters
         # Handle single date vs range tuple
         if isinstance(dates, tuple):
             if len(dates) == 2:
                 start_d, end_d = dates
-                mask = (df['day'] >= str(start_d)) & (df['day'] <= str(end_d))
             elif len(dates) == 1:
-                mask = (df['day'] == str(dates[0]))
+                start_d = end_d = dates[0]
             else:
-                mask = [True] * len(df)
+                start_d, end_d = min_date, max_date
         else:
-            mask = (df['day'] == str(dates))
-            
-        mask &= df['zone'].isin(zones)
-        mask &= df['crime_type'].isin(crimes)
-        filtered_df = df.loc[mask]
+            start_d = end_d = dates
+
+        filter_key = (start_d, end_d, tuple(zones), tuple(crimes))
+        counts, trend, hexes, log_rows, kpis = compute_view(filter_key)
     else:
-        filtered_df = pd.DataFrame()
+        kpis = {}
 
 # -----------------------------------------------------------------------------
 # 4. HEADER & KPI GRID
 # -----------------------------------------------------------------------------
 st.markdown("<h1>NCT SURVEILLANCE GRID <span style='font-size:1rem; color:#00f0ff; vertical-align:middle; float:right;'>● LIVE FEED</span></h1>", unsafe_allow_html=True)
 
-if filtered_df.empty:
+if not kpis:
     st.error("SYSTEM OFFLINE: NO DATA FOUND. CHECK CONNECTION.")
     st.stop()
 
 # KPIs
 k1, k2, k3, k4 = st.columns(4)
 
-total = len(filtered_df)
-risk_zone = filtered_df['zone'].mode()[0]
-primary_code = filtered_df['crime_type'].mode()[0]
-peak_h = f"{filtered_df['hour'].mode()[0]}:00"
+total = kpis["total"]
+risk_zone = kpis["risk_zone"]
+primary_code = kpis["primary_code"]
+peak_h = kpis["peak_h"]
 
 def kpi_card(label, value):
     return f"""
@@ -177,22 +327,44 @@ k2.markdown(kpi_card("HIGH RISK SECTOR", risk_zone), unsafe_allow_html=True)
 k3.markdown(kpi_card("PRIMARY OFFENSE", primary_code), unsafe_allow_html=True)
 k4.markdown(kpi_card("PEAK ACTIVITY", peak_h), unsafe_allow_html=True)
 
-# -----------------------------------------------------------------------------
-# 5. MAIN COMMAND INTERFACE
-# -----------------------------------------------------------------------------
-col_3d, col_analytics = st.columns([0.65, 0.35])
+# Chart and map skeletons (template, fonts, view state, layer config) are built
+# once per session and only their data is swapped on rerun
+def bar_skeleton():
+    fig = go.Figure(go.Bar(orientation='h', marker=dict(color='#00f0ff', line=dict(color='#fff', width=1))))
+    fig.update_layout(
+        template="plotly_dark",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Rajdhani", color="#00f0ff"),
+        margin=dict(l=0, r=0, t=0, b=0),
+        height=250,
+        xaxis_title="Count",
+        yaxis=dict(title="Type", autorange="reversed") # Highest on top
+    )
+    return fig
 
-with col_3d:
-    st.markdown("**🌐 3D GEOSPATIAL EXTRUSION**")
-    
+def trend_skeleton():
+    # WebGL trace: stays responsive when the window spans many days
+    fig = go.Figure(go.Scattergl(mode='lines', fill='tozeroy', line_color='#bf00ff', fillcolor='rgba(191, 0, 255, 0.2)'))
+    fig.update_layout(
+        template="plotly_dark",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family="Rajdhani", color="#888"),
+        margin=dict(l=0, r=0, t=20, b=0),
+        height=200,
+        xaxis_title=None,
+        yaxis_title=None
+    )
+    return fig
+
+def deck_skeleton():
     # 3D MAP CONFIGURATION (DECK.GL)
     layer = pdk.Layer(
-        "HexagonLayer",
-        data=filtered_df,
-        get_position=["longitude", "latitude"],
-        radius=200,                # Radius of bin
-        elevation_scale=5,         # Height of bars
-        elevation_range=[0, 100],
+        "H3HexagonLayer",
+        id="crime-hexes",          # Stable id: deck.gl updates the layer in place across reruns
+        get_hexagon="h3",          # Pre-binned server side
+        get_elevation="count",
         extruded=True,
         pickable=True,
         # Neon Gradient: Purple to Cyan
@@ -208,13 +380,34 @@ with col_3d:
     )
 
     # Dark Map Style
-    deck = pdk.Deck(
+    return pdk.Deck(
         layers=[layer],
         initial_view_state=view_state,
         # Use this style which requires NO API Token
         map_style="https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json", 
-        tooltip={"html": "<b>Density:</b> {elevationValue}", "style": {"backgroundColor": "#111", "color": "#00f0ff"}}
+        tooltip={"html": "<b>Density:</b> {count}", "style": {"backgroundColor": "#111", "color": "#00f0ff"}}
     )
+
+def chart_skeleton(key, build):
+    # Kept in session_state rather than st.cache_resource: the object is
+    # mutated every rerun, so it must not be shared between sessions
+    if key not in st.session_state:
+        st.session_state[key] = build()
+    return st.session_state[key]
+
+# -----------------------------------------------------------------------------
+# 5. MAIN COMMAND INTERFACE
+# -----------------------------------------------------------------------------
+col_3d, col_analytics = st.columns([0.65, 0.35])
+
+with col_3d:
+    st.markdown("**🌐 3D GEOSPATIAL EXTRUSION**")
+    
+    deck = chart_skeleton("deck", deck_skeleton)
+    layer = deck.layers[0]
+    layer.data = hexes
+    # Height of bars: tallest hexagon at 500m, like HexagonLayer's 0-100 range x5
+    layer.elevation_scale = 500 / hexes['count'].max() if len(hexes) else 1
     
     st.pydeck_chart(deck)
 
@@ -222,34 +415,13 @@ with col_analytics:
     st.markdown("**� TACTICAL BREAKDOWN**")
     
     # 1. Neon Bar Chart
-    counts = filtered_df['crime_type'].value_counts().reset_index()
-    counts.columns = ['Type', 'Count']
-    
-    fig_bar = px.bar(counts, x='Count', y='Type', orientation='h', template="plotly_dark")
-    fig_bar.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(family="Rajdhani", color="#00f0ff"),
-        margin=dict(l=0, r=0, t=0, b=0),
-        height=250,
-        yaxis=dict(autorange="reversed") # Highest on top
-    )
-    fig_bar.update_traces(marker_color='#00f0ff', marker_line_color='#fff', marker_line_width=1)
+    fig_bar = chart_skeleton("fig_bar", bar_skeleton)
+    fig_bar.data[0].update(x=counts['Count'], y=counts['Type'])
     st.plotly_chart(fig_bar, use_container_width=True)
     
     # 2. Neon Area Trend
-    trend = filtered_df.groupby('date').size().reset_index(name='Count')
-    fig_trend = px.area(trend, x='date', y='Count', template="plotly_dark")
-    fig_trend.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(family="Rajdhani", color="#888"),
-        margin=dict(l=0, r=0, t=20, b=0),
-        height=200,
-        xaxis_title=None,
-        yaxis_title=None
-    )
-    fig_trend.update_traces(line_color='#bf00ff', fillcolor='rgba(191, 0, 255, 0.2)')
+    fig_trend = chart_skeleton("fig_trend", trend_skeleton)
+    fig_trend.data[0].update(x=trend['date'], y=trend['Count'])
     st.plotly_chart(fig_trend, use_container_width=True)
 
 # -----------------------------------------------------------------------------
@@ -257,7 +429,7 @@ with col_analytics:
 # -----------------------------------------------------------------------------
 with st.expander("📂 DECLASSIFIED DATA LOGS", expanded=False):
     st.dataframe(
-        filtered_df[['date', 'hour', 'zone', 'crime_type', 'latitude', 'longitude']].sort_values('date', ascending=False),
+        log_rows,
         use_container_width=True,
         height=300
     )